@@ -12,10 +12,13 @@ class Settings(BaseSettings):
     
     # OpenAI API settings
     openai_api_key: str
+    openai_use_system_proxy: bool = True  # Honour HTTP(S)_PROXY env vars for API calls
+    openai_max_concurrent: int = 8  # Concurrent OpenAI API requests per process
     
     # Optional application settings
     app_name: str = "Text to Image API"
     debug: bool = False
+    cors_origins: str = "*"  # Comma-separated list of allowed origins
     
     class Config:
         env_file = ".env"
@@ -1,18 +1,57 @@
-from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
-from pydantic import BaseModel, Field
-from typing import List, Optional, Tuple
-import base64
+from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import ORJSONResponse, Response
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError
+from typing import Any, Dict, List, Optional, Tuple, Type
+from functools import lru_cache
+import httpx
+import logging
+import pybase64
 import os
 from app.services.openai_service import generate_image
 from app.services.image_processing_service import process_image_with_text
 from app.config import get_settings
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(
     prefix="/images",
     tags=["Images"],
     responses={404: {"description": "Not found"}},
+    default_response_class=ORJSONResponse,
 )
 
+# Image sizes supported by DALL-E
+VALID_SIZES = ["256x256", "512x512", "1024x1024", "1792x1024", "1024x1792"]
+
+# MIME types of the encodings /add-text can return
+OUTPUT_MEDIA_TYPES = {"PNG": "image/png", "JPEG": "image/jpeg", "WEBP": "image/webp"}
+
+# Background image used when no prompt is given
+STATIC_IMAGE_PATH = "static/image.jpg"
+
+@lru_cache(maxsize=1)
+def _static_image_bytes() -> bytes:
+    """
+    Get the contents of the default background image. Results are cached so
+    the file is read from disk once per process.
+    
+    Returns:
+        bytes: Raw contents of the static image
+    """
+    with open(STATIC_IMAGE_PATH, "rb") as f:
+        return f.read()
+
+@lru_cache(maxsize=1)
+def _static_image_b64() -> str:
+    """
+    Get the default background image as base64. Results are cached for performance.
+    
+    Returns:
+        str: Base64 encoded contents of the static image
+    """
+    return pybase64.b64encode_as_string(_static_image_bytes())
+
 class ImageGenerationRequest(BaseModel):
     prompt: str
     n: Optional[int] = 1
@@ -21,6 +60,8 @@ class ImageGenerationRequest(BaseModel):
     style: Optional[str] = "vivid"  # can be "vivid" or "natural"
     quality: Optional[str] = "standard"  # can be "standard" or "hd"
 
+# Response models document the routes; the routes return ORJSONResponse directly
+# so large base64 payloads skip response-model validation
 class ImageGenerationResponse(BaseModel):
     images: List[str]
     prompt: str
@@ -38,13 +79,48 @@ class TextOverlayRequest(BaseModel):
     bg_opacity: Optional[float] = Field(default=0.8, ge=0.0, le=1.0)
     padding: Optional[int] = Field(default=16, ge=0, le=128)
     border_radius: Optional[int] = Field(default=16, ge=0, le=128)
+    output_format: Optional[str] = Field(default="JPEG", pattern="^(PNG|JPEG|WEBP)$")
 
 class TextOverlayResponse(BaseModel):
     image: str  # base64 encoded image
     text: str
+    media_type: str  # MIME type of the encoded image, e.g. "image/jpeg"
+
+# Request validators, built once and reused for every request. Bodies are
+# validated straight from JSON bytes, which matters for large base64 images.
+_IMAGE_REQ_ADAPTER = TypeAdapter(ImageGenerationRequest)
+_OVERLAY_REQ_ADAPTER = TypeAdapter(TextOverlayRequest)
 
-@router.post("/generate", response_model=ImageGenerationResponse)
-async def create_image(request: ImageGenerationRequest):
+def _request_body_schema(model: Type[BaseModel]) -> Dict[str, Any]:
+    """Build the OpenAPI request body for a route that parses its own body."""
+    return {
+        "requestBody": {
+            "content": {"application/json": {"schema": model.model_json_schema()}},
+            "required": True,
+        }
+    }
+
+async def _parse_body(http_request: Request, adapter: TypeAdapter) -> Any:
+    """
+    Validate the raw request body with a prebuilt TypeAdapter.
+    
+    Raises:
+        RequestValidationError: If the body is invalid, so FastAPI returns its usual 422
+    """
+    try:
+        return adapter.validate_json(await http_request.body())
+    except ValidationError as e:
+        # Locate errors under "body" as FastAPI does for declared body parameters
+        raise RequestValidationError(
+            [{**error, "loc": ("body", *error["loc"])} for error in e.errors(include_url=False)]
+        )
+
+@router.post(
+    "/generate",
+    response_model=ImageGenerationResponse,
+    openapi_extra=_request_body_schema(ImageGenerationRequest),
+)
+async def create_image(http_request: Request):
     """
     Generate images based on a text prompt using OpenAI's DALL-E.
     
@@ -55,50 +131,54 @@ async def create_image(request: ImageGenerationRequest):
     - **style**: Style of the generated images (vivid or natural)
     - **quality**: Quality of the generated images (standard or hd)
     """
+    request: ImageGenerationRequest = await _parse_body(http_request, _IMAGE_REQ_ADAPTER)
     try:
         # Validate number of images
         if request.n < 1 or request.n > 10:
             raise HTTPException(status_code=400, detail="Number of images must be between 1 and 10")
         
         # Validate image size
-        valid_sizes = ["256x256", "512x512", "1024x1024", "1792x1024", "1024x1792"]
-        if request.size not in valid_sizes:
-            raise HTTPException(status_code=400, detail=f"Size must be one of {valid_sizes}")
+        if request.size not in VALID_SIZES:
+            raise HTTPException(status_code=400, detail=f"Size must be one of {VALID_SIZES}")
 
         # If prompt is empty, use static/image.jpg as background
         if not request.prompt.strip():
-            # Read the static image as bytes
-            static_image_path = "static/image.jpg"
+            chinese_text = getattr(request, 'chinese_text', None) or ""
+            # Without text to overlay, return the cached encoding of the static image
+            if not chinese_text.strip():
+                try:
+                    base64_image = _static_image_b64()
+                except Exception as e:
+                    raise HTTPException(status_code=500, detail=f"Failed to load default image: {e}")
+                return ORJSONResponse({"images": [base64_image], "prompt": request.prompt})
+            # Get the static image as bytes
             try:
-                with open(static_image_path, "rb") as f:
-                    image_bytes = f.read()
+                image_bytes = _static_image_bytes()
             except Exception as e:
                 raise HTTPException(status_code=500, detail=f"Failed to load default image: {e}")
-            # Apply overlay if Chinese text is provided
-            chinese_text = getattr(request, 'chinese_text', None) or ""
-            if chinese_text.strip():
-                # Use overlay parameters from request if available
-                overlay_bytes = await process_image_with_text(
-                    image_source=image_bytes,
-                    text=chinese_text,
-                    font_size=getattr(request, 'font_size', 60),
-                    position=getattr(request, 'position', (0, 0)),
-                    color=getattr(request, 'color', (255, 255, 255)),
-                    opacity=getattr(request, 'opacity', 0.8),
-                    align=getattr(request, 'align', 'center'),
-                    font_path=getattr(request, 'font_path', None),
-                    bg_color=getattr(request, 'bg_color', (255, 255, 0)),
-                    bg_opacity=getattr(request, 'bg_opacity', 0.8),
-                    padding=getattr(request, 'padding', 16),
-                    border_radius=getattr(request, 'border_radius', 16)
-                )
-                image_bytes = overlay_bytes
+            # Apply overlay with parameters from request if available
+            image_bytes = await process_image_with_text(
+                image_source=image_bytes,
+                text=chinese_text,
+                font_size=getattr(request, 'font_size', 60),
+                position=getattr(request, 'position', (0, 0)),
+                color=getattr(request, 'color', (255, 255, 255)),
+                opacity=getattr(request, 'opacity', 0.8),
+                align=getattr(request, 'align', 'center'),
+                font_path=getattr(request, 'font_path', None),
+                bg_color=getattr(request, 'bg_color', (255, 255, 0)),
+                bg_opacity=getattr(request, 'bg_opacity', 0.8),
+                padding=getattr(request, 'padding', 16),
+                border_radius=getattr(request, 'border_radius', 16),
+                output_format=getattr(request, 'output_format', 'JPEG')
+            )
             # Return as base64
-            base64_image = base64.b64encode(image_bytes).decode('utf-8')
-            return ImageGenerationResponse(images=[base64_image], prompt=request.prompt)
+            base64_image = pybase64.b64encode_as_string(image_bytes)
+            return ORJSONResponse({"images": [base64_image], "prompt": request.prompt})
 
         # Normal DALL-E flow
         images = await generate_image(
+            client=http_request.app.state.openai_client,
             prompt=request.prompt,
             n=request.n,
             size=request.size,
@@ -106,12 +186,58 @@ async def create_image(request: ImageGenerationRequest):
             style=request.style,
             quality=request.quality
         )
-        return ImageGenerationResponse(images=images, prompt=request.prompt)
+        return ORJSONResponse({"images": images, "prompt": request.prompt})
+    except (HTTPException, httpx.RequestError):
+        raise
     except Exception as e:
+        logger.exception("Unexpected error handling image request")
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.post("/add-text", response_model=TextOverlayResponse)
-async def add_text_to_image(request: TextOverlayRequest):
+@router.post(
+    "/generate/raw",
+    response_class=Response,
+    responses={200: {"content": {"image/png": {}}}},
+    openapi_extra=_request_body_schema(ImageGenerationRequest),
+)
+async def create_image_raw(http_request: Request):
+    """
+    Generate a single image and return the decoded PNG bytes instead of base64 JSON.
+    
+    Takes the same body as /generate. **prompt** must not be empty, **n** must be 1,
+    and **response_format** is ignored.
+    """
+    request: ImageGenerationRequest = await _parse_body(http_request, _IMAGE_REQ_ADAPTER)
+    if not request.prompt.strip():
+        raise HTTPException(status_code=400, detail="Prompt must not be empty")
+    if request.n != 1:
+        raise HTTPException(status_code=400, detail="Number of images must be 1")
+    if request.size not in VALID_SIZES:
+        raise HTTPException(status_code=400, detail=f"Size must be one of {VALID_SIZES}")
+    try:
+        images = await generate_image(
+            client=http_request.app.state.openai_client,
+            prompt=request.prompt,
+            n=1,
+            size=request.size,
+            response_format="b64_json",
+            style=request.style,
+            quality=request.quality
+        )
+        # Decode once here so clients receive 25% fewer bytes and skip decoding
+        image_bytes = pybase64.b64decode(images[0], validate=False)
+    except (HTTPException, httpx.RequestError):
+        raise
+    except Exception as e:
+        logger.exception("Unexpected error handling image request")
+        raise HTTPException(status_code=500, detail=str(e))
+    return Response(content=image_bytes, media_type="image/png")
+
+@router.post(
+    "/add-text",
+    response_model=TextOverlayResponse,
+    openapi_extra=_request_body_schema(TextOverlayRequest),
+)
+async def add_text_to_image(http_request: Request):
     """
     Add text overlay to an image.
     
@@ -123,7 +249,9 @@ async def add_text_to_image(request: TextOverlayRequest):
     - **opacity**: Text opacity (0.0 to 1.0)
     - **align**: Text alignment ("left", "center", or "right")
     - **font_path**: Optional path to a font file
+    - **output_format**: Encoding of the returned image ("PNG", "JPEG", or "WEBP")
     """
+    request: TextOverlayRequest = await _parse_body(http_request, _OVERLAY_REQ_ADAPTER)
     try:
         # Process the image with text overlay
         processed_image = await process_image_with_text(
@@ -138,15 +266,19 @@ async def add_text_to_image(request: TextOverlayRequest):
             bg_color=request.bg_color,
             bg_opacity=request.bg_opacity,
             padding=request.padding,
-            border_radius=request.border_radius
+            border_radius=request.border_radius,
+            output_format=request.output_format
         )
         
         # Convert the processed image to base64
-        base64_image = base64.b64encode(processed_image).decode('utf-8')
+        base64_image = pybase64.b64encode_as_string(processed_image)
         
-        return TextOverlayResponse(
-            image=base64_image,
-            text=request.text
-        )
+        return ORJSONResponse({
+            "image": base64_image,
+            "text": request.text,
+            "media_type": OUTPUT_MEDIA_TYPES[request.output_format]
+        })
+    except (HTTPException, httpx.RequestError):
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
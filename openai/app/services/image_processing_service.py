@@ -1,15 +1,64 @@
 from PIL import Image, ImageDraw, ImageFont
 import io
-import base64
+import pybase64
 import httpx
 import logging
+from fastapi.concurrency import run_in_threadpool
 from typing import Union, Tuple, Optional
+from functools import lru_cache
+from collections import OrderedDict
+import xxhash
 import os
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# System fonts that support Chinese characters, in order of preference
+_SYSTEM_FONTS = [
+    "/System/Library/Fonts/PingFang.ttc",  # macOS
+    "/System/Library/Fonts/STHeiti Light.ttc",  # macOS
+    "/usr/share/fonts/truetype/droid/DroidSansFallbackFull.ttf",  # Linux
+    "C:\\Windows\\Fonts\\msyh.ttc",  # Windows
+]
+
+# Resolved once at import; falls back to a default font if no system font is found
+_DEFAULT_FONT_PATH = next((p for p in _SYSTEM_FONTS if os.path.exists(p)), "arial.ttf")
+
+# RGBA fills for the default text and background colors and opacities
+_DEFAULT_TEXT_RGBA = (255, 255, 255, int(255 * 0.8))
+_DEFAULT_BG_RGBA = (255, 255, 0, int(255 * 0.8))
+
+# Rendered overlays keyed by (image digest, config key), least recently used first.
+# Bounded by total size since a single PNG render can be several megabytes;
+# this budget applies per worker process.
+_RENDER_CACHE_MAX_BYTES = 32 * 1024 * 1024
+_RENDER_CACHE: "OrderedDict[tuple, bytes]" = OrderedDict()
+_render_cache_bytes = 0
+
+# Shared HTTP client for downloading source images, created lazily
+_HTTP_CLIENT: Optional[httpx.AsyncClient] = None
+
+async def get_http_client() -> httpx.AsyncClient:
+    """
+    Get the shared HTTP client used to download images, creating it on first use.
+    
+    Returns:
+        httpx.AsyncClient: Client with a pooled, keep-alive connection set
+    """
+    global _HTTP_CLIENT
+    if _HTTP_CLIENT is None:
+        _HTTP_CLIENT = httpx.AsyncClient(
+            timeout=30.0,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20)
+        )
+    return _HTTP_CLIENT
+
+async def close_http_client() -> None:
+    """Close the shared HTTP client, if it was created."""
+    global _HTTP_CLIENT
+    if _HTTP_CLIENT is not None:
+        await _HTTP_CLIENT.aclose()
+        _HTTP_CLIENT = None
+
 class TextOverlayConfig:
     def __init__(
         self,
@@ -23,7 +72,8 @@ class TextOverlayConfig:
         bg_color: Optional[Tuple[int, int, int]] = None,
         bg_opacity: float = 0.8,
         padding: int = 16,
-        border_radius: int = 16
+        border_radius: int = 16,
+        output_format: str = "JPEG"
     ):
         self.text = text
         self.font_size = font_size
@@ -36,23 +86,128 @@ class TextOverlayConfig:
         self.bg_opacity = bg_opacity
         self.padding = padding
         self.border_radius = border_radius
+        self.output_format = output_format  # "PNG", "JPEG" or "WEBP"
+
+    def cache_key(self) -> tuple:
+        """Get a hashable key covering every setting that affects the rendered output."""
+        return (
+            self.text, self.font_size, self.font_path, tuple(self.position),
+            tuple(self.color), self.opacity, self.align, tuple(self.bg_color),
+            self.bg_opacity, self.padding, self.border_radius, self.output_format
+        )
 
     def _get_default_font(self) -> str:
         """Get the default font path for Chinese text."""
-        # Try to find a system font that supports Chinese characters
-        system_fonts = [
-            "/System/Library/Fonts/PingFang.ttc",  # macOS
-            "/System/Library/Fonts/STHeiti Light.ttc",  # macOS
-            "/usr/share/fonts/truetype/droid/DroidSansFallbackFull.ttf",  # Linux
-            "C:\\Windows\\Fonts\\msyh.ttc",  # Windows
-        ]
-        
-        for font_path in system_fonts:
-            if os.path.exists(font_path):
-                return font_path
+        return _DEFAULT_FONT_PATH
+
+def _cache_render(key: tuple, result: bytes) -> None:
+    """Store a rendered overlay, evicting least recently used entries to stay within budget."""
+    global _render_cache_bytes
+    # Renders larger than an eighth of the budget would evict too much to be worth keeping
+    if len(result) > _RENDER_CACHE_MAX_BYTES // 8 or key in _RENDER_CACHE:
+        return
+    _RENDER_CACHE[key] = result
+    _render_cache_bytes += len(result)
+    while _render_cache_bytes > _RENDER_CACHE_MAX_BYTES:
+        _, evicted = _RENDER_CACHE.popitem(last=False)
+        _render_cache_bytes -= len(evicted)
+
+@lru_cache(maxsize=64)
+def _load_font(path: str, size: int) -> ImageFont.FreeTypeFont:
+    """Load a TrueType font. Results are cached per (path, size)."""
+    return ImageFont.truetype(path, size)
+
+@lru_cache(maxsize=1)
+def _load_default_font() -> ImageFont.ImageFont:
+    """Load PIL's built-in bitmap font. Cached per process."""
+    return ImageFont.load_default()
+
+def _render_overlay_sync(image_data: bytes, config: TextOverlayConfig) -> bytes:
+    """
+    Render the text overlay onto the image. Blocking; run it in a worker thread.
+    
+    Args:
+        image_data: Encoded source image
+        config: TextOverlayConfig object containing text overlay settings
         
-        # If no system font is found, use a default font
-        return "arial.ttf"
+    Returns:
+        bytes: The processed image data
+    """
+    # Open image from bytes
+    image = Image.open(io.BytesIO(image_data))
+    
+    # Convert to RGB if not already
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    
+    # Draw straight onto the image; RGBA fills are alpha-blended in place.
+    # Fully opaque overlays skip blending and draw plain RGB fills.
+    needs_alpha = config.bg_opacity < 1.0 or config.opacity < 1.0
+    draw = ImageDraw.Draw(image, 'RGBA') if needs_alpha else ImageDraw.Draw(image)
+    
+    # Load font
+    try:
+        font = _load_font(config.font_path, config.font_size)
+    except Exception as e:
+        logger.warning(f"Failed to load specified font: {e}")
+        # Fallback to default font
+        font = _load_default_font()
+    
+    # Calculate text size across all lines; single lines are measured
+    # straight from the font without going through the draw context
+    line_spacing = int(config.font_size * 0.2)  # Gap between lines
+    if '\n' in config.text:
+        text_bbox = draw.multiline_textbbox((0, 0), config.text, font=font, spacing=line_spacing)
+    else:
+        text_bbox = font.getbbox(config.text)
+    text_width = text_bbox[2] - text_bbox[0]
+    text_height = text_bbox[3] - text_bbox[1]
+    
+    # Calculate background rectangle
+    bg_x = (image.width - text_width) // 2 if config.align == "center" else (
+        image.width - text_width - config.position[0] if config.align == "right" else config.position[0]
+    )
+    bg_y = config.position[1]
+    rect_x0 = bg_x - config.padding
+    rect_y0 = bg_y - config.padding
+    rect_x1 = bg_x + text_width + config.padding
+    # Add extra bottom padding for harmony
+    extra_bottom_padding = int(config.font_size * 0.4)
+    rect_y1 = bg_y + text_height + config.padding + extra_bottom_padding
+    
+    # Draw rounded rectangle background
+    if not needs_alpha:
+        bg_color_with_opacity = tuple(config.bg_color)
+    elif config.bg_color == (255, 255, 0) and config.bg_opacity == 0.8:
+        bg_color_with_opacity = _DEFAULT_BG_RGBA
+    else:
+        bg_color_with_opacity = (*config.bg_color, int(255 * config.bg_opacity))
+    draw.rounded_rectangle(
+        [rect_x0, rect_y0, rect_x1, rect_y1],
+        radius=config.border_radius,
+        fill=bg_color_with_opacity
+    )
+    # Draw text with opacity, aligning each line within the text block;
+    # a 1px stroke in the text color simulates bold
+    if not needs_alpha:
+        color_with_opacity = tuple(config.color)
+    elif config.color == (255, 255, 255) and config.opacity == 0.8:
+        color_with_opacity = _DEFAULT_TEXT_RGBA
+    else:
+        color_with_opacity = (*config.color, int(255 * config.opacity))
+    draw.multiline_text(
+        (bg_x, bg_y), config.text, font=font, fill=color_with_opacity,
+        spacing=line_spacing, align=config.align,
+        stroke_width=1, stroke_fill=color_with_opacity
+    )
+    
+    # Save to bytes
+    output = io.BytesIO()
+    if config.output_format == 'PNG':
+        image.save(output, format='PNG')
+    else:
+        image.save(output, format=config.output_format, quality=90)
+    return output.getvalue()
 
 async def add_text_overlay(
     image_source: Union[str, bytes],
@@ -62,7 +217,7 @@ async def add_text_overlay(
     Add text overlay to an image, with Xiaohongshu-style background.
     
     Args:
-        image_source: URL or base64 encoded image data
+        image_source: URL or base64 encoded image data, or raw image bytes
         config: TextOverlayConfig object containing text overlay settings
         
     Returns:
@@ -73,88 +228,28 @@ async def add_text_overlay(
         if isinstance(image_source, str):
             if image_source.startswith('http'):
                 # Download image from URL
-                async with httpx.AsyncClient() as client:
-                    response = await client.get(image_source)
-                    image_data = response.content
+                client = await get_http_client()
+                response = await client.get(image_source)
+                response.raise_for_status()
+                image_data = response.content
             else:
                 # Assume it's base64 encoded
-                image_data = base64.b64decode(image_source)
+                image_data = pybase64.b64decode(image_source, validate=False)
         else:
             image_data = image_source
 
-        # Open image from bytes
-        image = Image.open(io.BytesIO(image_data))
-        
-        # Convert to RGBA if not already
-        if image.mode != 'RGBA':
-            image = image.convert('RGBA')
-        
-        # Create a new transparent layer for the text
-        txt_layer = Image.new('RGBA', image.size, (0, 0, 0, 0))
-        draw = ImageDraw.Draw(txt_layer)
-        
-        # Load font
-        try:
-            font = ImageFont.truetype(config.font_path, config.font_size)
-        except Exception as e:
-            logger.warning(f"Failed to load specified font: {e}")
-            # Fallback to default font
-            font = ImageFont.load_default()
-        
-        # Calculate text position and size
-        text_bbox = draw.textbbox(config.position, config.text, font=font)
-        text_width = text_bbox[2] - text_bbox[0]
-        text_height = text_bbox[3] - text_bbox[1]
-        
-        # Calculate background rectangle
-        bg_x = (image.width - text_width) // 2 if config.align == "center" else (
-            image.width - text_width - config.position[0] if config.align == "right" else config.position[0]
-        )
-        bg_y = config.position[1]
-        rect_x0 = bg_x - config.padding
-        rect_y0 = bg_y - config.padding
-        rect_x1 = bg_x + text_width + config.padding
-        # Add extra bottom padding for harmony
-        extra_bottom_padding = int(config.font_size * 0.4)
-        rect_y1 = bg_y + text_height + config.padding + extra_bottom_padding
-        
-        # Draw rounded rectangle background
-        bg_color_with_opacity = (*config.bg_color, int(255 * config.bg_opacity))
-        draw.rounded_rectangle(
-            [rect_x0, rect_y0, rect_x1, rect_y1],
-            radius=config.border_radius,
-            fill=bg_color_with_opacity
-        )
-        # Draw text with opacity, center each line
-        color_with_opacity = (*config.color, int(255 * config.opacity))
-        lines = config.text.split('\n')
-        line_spacing = int(config.font_size * 1.2)  # 1.2x font size for spacing
-        for i, line in enumerate(lines):
-            bbox = draw.textbbox((0, 0), line, font=font)
-            line_width = bbox[2] - bbox[0]
-            line_height = bbox[3] - bbox[1]
-            if config.align == "center":
-                line_x = bg_x + (text_width - line_width) // 2
-            elif config.align == "right":
-                line_x = bg_x + (text_width - line_width)
-            else:  # left
-                line_x = bg_x
-            line_y = bg_y + i * line_spacing
-            # Simulate bold by drawing text multiple times with slight offsets
-            for dx, dy in [(0,0), (-1,0), (1,0), (0,-1), (0,1)]:
-                draw.text((line_x+dx, line_y+dy), line, font=font, fill=color_with_opacity)
-        
-        # Composite the text layer onto the image
-        result = Image.alpha_composite(image, txt_layer)
+        # Identical image and settings render to identical bytes
+        key = (xxhash.xxh3_128_digest(image_data), config.cache_key())
+        cached = _RENDER_CACHE.get(key)
+        if cached is not None:
+            _RENDER_CACHE.move_to_end(key)
+            return cached
         
-        # Convert back to RGB if needed
-        if result.mode == 'RGBA':
-            result = result.convert('RGB')
+        # Render off the event loop; PIL releases the GIL while encoding
+        result = await run_in_threadpool(_render_overlay_sync, image_data, config)
         
-        # Save to bytes
-        output = io.BytesIO()
-        result.save(output, format='PNG')
-        return output.getvalue()
+        _cache_render(key, result)
+        return result
         
     except Exception as e:
         logger.error(f"Error adding text overlay: {str(e)}")
@@ -172,7 +267,8 @@ async def process_image_with_text(
     bg_color: Optional[Tuple[int, int, int]] = None,
     bg_opacity: float = 0.8,
     padding: int = 16,
-    border_radius: int = 16
+    border_radius: int = 16,
+    output_format: str = "JPEG"
 ) -> bytes:
     """
     Convenience function to process an image with text overlay, supporting Xiaohongshu style.
@@ -188,6 +284,7 @@ async def process_image_with_text(
         bg_color=bg_color,
         bg_opacity=bg_opacity,
         padding=padding,
-        border_radius=border_radius
+        border_radius=border_radius,
+        output_format=output_format
     )
     return await add_text_overlay(image_source, config) 
\ No newline at end of file
@@ -1,18 +1,163 @@
+import asyncio
 import httpx
-import json
+import orjson
+import ijson
 import logging
+import operator
+import random
 import socket
 from typing import List, Optional, Dict, Any
 import os
 import sys
+from functools import lru_cache
 from fastapi import HTTPException
 from app.config import get_settings
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def process_response(response, response_format):
+# OpenAI image generation endpoint and the request fields that never change
+IMAGES_URL = "https://api.openai.com/v1/images/generations"
+_BASE_PAYLOAD = {"model": "dall-e-3"}
+
+# Retries for failed connections and rate-limited or failed API requests
+MAX_RETRIES = 3
+
+# Response statuses worth retrying, and the cap on how long to wait between tries.
+# Only statuses where the image was not generated: after a 500, 502 or 504 it
+# may have been, and a retry would be billed twice.
+RETRY_STATUS_CODES = frozenset({429, 503})
+MAX_RETRY_DELAY = 20.0
+
+@lru_cache(maxsize=1)
+def _semaphore() -> asyncio.Semaphore:
+    """
+    Get the semaphore capping concurrent OpenAI API requests. Created on
+    first use so it belongs to the running event loop.
+    
+    Returns:
+        asyncio.Semaphore: Shared semaphore for OpenAI API requests
+    """
+    return asyncio.Semaphore(get_settings().openai_max_concurrent)
+
+@lru_cache(maxsize=1)
+def _headers() -> Dict[str, str]:
+    """
+    Get the headers for OpenAI API requests. Results are cached, so callers
+    must not modify the returned dict.
+    
+    Returns:
+        Dict[str, str]: Request headers including the API key
+    """
+    api_key = get_settings().openai_api_key
+    
+    # Log the API key length to check if it's properly loaded (don't log the actual key)
+    logger.info(f"Using OpenAI API Key (length: {len(api_key) if api_key else 0})")
+    
+    if not api_key:
+        logger.error("OpenAI API key is missing")
+        raise ValueError("OpenAI API key is missing or invalid")
+    
+    return {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {api_key}"
+    }
+
+def create_client(trust_env: bool = True) -> httpx.AsyncClient:
+    """
+    Create the HTTP client for OpenAI API calls. Build it once at startup and
+    share it, so connections to the API are kept alive and reused.
+    
+    Args:
+        trust_env: Whether to honour proxy settings from the environment
+        
+    Returns:
+        httpx.AsyncClient: Pooled HTTP/2 client for the OpenAI API
+    """
+    # Pool options go to the client itself rather than a custom transport,
+    # which would stop httpx from mounting the environment's proxies
+    return httpx.AsyncClient(
+        trust_env=trust_env,
+        http2=True,
+        timeout=httpx.Timeout(60.0, connect=10.0),
+        # One HTTP/2 connection multiplexes many requests, and concurrency
+        # is already capped by the semaphore, so a small pool suffices
+        limits=httpx.Limits(
+            max_keepalive_connections=get_settings().openai_max_concurrent,
+            max_connections=10,
+            keepalive_expiry=30.0
+        )
+    )
+
+@lru_cache(maxsize=1)
+def log_network_info() -> None:
+    """
+    Log network environment information to help debug connectivity issues.
+    Blocking DNS lookups; call once at startup, never per request.
+    """
+    try:
+        hostname = socket.gethostname()
+        local_ip = socket.gethostbyname(hostname)
+        logger.info(f"Network environment: hostname={hostname}, local_ip={local_ip}")
+        
+        # Try to resolve OpenAI's domain
+        openai_ip = socket.gethostbyname("api.openai.com")
+        logger.info(f"Successfully resolved api.openai.com to {openai_ip}")
+    except Exception as e:
+        logger.warning(f"Failed to get network information: {str(e)}")
+    
+    # Log proxy environment variables
+    proxy_env_vars = {k: v for k, v in os.environ.items() if 'proxy' in k.lower()}
+    logger.info(f"Proxy environment variables: {proxy_env_vars}")
+
+def _retry_delay(response: Optional[httpx.Response], attempt: int) -> float:
+    """
+    Get how long to wait before retrying a failed request. Honours the
+    Retry-After header when the API sends one, otherwise backs off
+    exponentially. Jitter keeps concurrent retries from arriving together.
+    
+    Args:
+        response: The failed response, or None if the connection failed
+        attempt: Zero-based number of the attempt that failed
+        
+    Returns:
+        float: Delay in seconds
+    """
+    try:
+        delay = float(response.headers["retry-after"])
+    except (AttributeError, KeyError, ValueError):
+        delay = 2.0 ** attempt
+    return min(delay, MAX_RETRY_DELAY) + random.uniform(0, 1)
+
+class _AsyncResponseReader:
+    """Async file-like view of a streamed httpx response body, for ijson."""
+    
+    def __init__(self, response: httpx.Response, chunk_size: int = 65536):
+        self._chunks = response.aiter_bytes(chunk_size)
+        self._buffer = b""
+    
+    async def read(self, size: int = -1) -> bytes:
+        # ijson probes with read(0) to detect bytes vs text; don't consume data for it
+        if size == 0:
+            return b""
+        while not self._buffer:
+            try:
+                self._buffer = await self._chunks.__anext__()
+            except StopAsyncIteration:
+                return b""
+        # Short reads are fine; only an empty result means end of stream
+        if size < 0 or size >= len(self._buffer):
+            data, self._buffer = self._buffer, b""
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+# Field extractors for each response format
+_EXTRACTORS = {
+    "url": operator.itemgetter("url"),
+    "b64_json": operator.itemgetter("b64_json"),
+}
+
+def process_response(parsed, response_format):
     """
     Process the API response and extract image data based on response format.
 
@@ -20,22 +165,18 @@ def process_response(response, response_format):
       Create a trendy social media cover image inspired by Xiaohongshu (RED) posts. Use a modern, youthful aesthetic with a light pastel or stylish vivid color palette. Include soft lighting, and a lifestyle/artistic vibe. Overlay elegant Chinese text "王老师艺术留学工作室" in a clean, semi-transparent font centered or toward the top. The design should look like a fashionable post promoting an art education brand for international students on Xiaohongshu.
 
     Args:
-        response: The HTTP response from the OpenAI API
+        parsed: The parsed JSON body of the OpenAI API response
         response_format: Format of the response (url or b64_json)
         
     Returns:
         List of URLs or base64 encoded JSON strings
     """
-    result = response.json()
-    logger.info("Successfully parsed OpenAI API response")
-    
     # Extract the image URLs or base64 data depending on the response format
-    if response_format == "url":
-        return [item["url"] for item in result["data"]]
-    else:  # b64_json
-        return [item["b64_json"] for item in result["data"]]
+    extract = _EXTRACTORS.get(response_format, _EXTRACTORS["b64_json"])
+    return list(map(extract, parsed["data"]))
 
 async def generate_image(
+    client: httpx.AsyncClient,
     prompt: str,
     n: int = 1,
     size: str = "1024x1024",
@@ -47,6 +188,7 @@ async def generate_image(
     Generate images using OpenAI's DALL-E model.
     
     Args:
+        client: Shared HTTP client from create_client
         prompt: Text description of the desired image
         n: Number of images to generate (1-10)
         size: Size of the generated images (256x256, 512x512, or 1024x1024)
@@ -57,108 +199,74 @@ async def generate_image(
     Returns:
         A list of image URLs or base64-encoded JSON strings
     """
-    try:
-        settings = get_settings()
-        
-        # Log the API key length to check if it's properly loaded (don't log the actual key)
-        api_key = settings.openai_api_key
-        logger.info(f"Using OpenAI API Key (length: {len(api_key) if api_key else 0})")
-        
-        if not api_key:
-            logger.error("OpenAI API key is missing")
-            raise ValueError("OpenAI API key is missing or invalid")
-        
-        # Define API endpoint and headers
-        url = "https://api.openai.com/v1/images/generations"
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {api_key}"
-        }
-        
-        # Log network environment information to help debug connectivity issues
+    url = IMAGES_URL
+    headers = _headers()
+    
+    # Prepare request data
+    data = {
+        **_BASE_PAYLOAD,
+        "prompt": prompt,
+        "n": n,
+        "size": size,
+        "response_format": response_format,
+        "style": style,
+        "quality": quality
+    }
+    
+    logger.debug("Making request to OpenAI API: %s with data: %s", url, data)
+    
+    for attempt in range(MAX_RETRIES + 1):
         try:
-            hostname = socket.gethostname()
-            local_ip = socket.gethostbyname(hostname)
-            logger.info(f"Network environment: hostname={hostname}, local_ip={local_ip}")
-            
-            # Try to resolve OpenAI's domain
-            openai_ip = socket.gethostbyname("api.openai.com")
-            logger.info(f"Successfully resolved api.openai.com to {openai_ip}")
-        except Exception as e:
-            logger.warning(f"Failed to get network information: {str(e)}")
-        
-        # Log proxy environment variables
-        proxy_env_vars = {k: v for k, v in os.environ.items() if 'proxy' in k.lower()}
-        logger.info(f"Proxy environment variables: {proxy_env_vars}")
+            async with _semaphore():
+                async with client.stream("POST", url, headers=headers, content=orjson.dumps(data)) as response:
+                    # Log the response status and headers
+                    logger.info(f"OpenAI API response status: {response.status_code}")
+                    logger.debug("OpenAI API response headers: %s", response.headers)
+                    
+                    # Base64 payloads are megabytes each; parse them as they stream in
+                    if response.status_code == 200 and response_format == "b64_json":
+                        images = [
+                            item async for item in
+                            ijson.items_async(_AsyncResponseReader(response), "data.item.b64_json")
+                        ]
+                        logger.info("Successfully parsed OpenAI API response")
+                        return images
+                    
+                    await response.aread()
+        except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+            # The request never reached the API, so retrying cannot duplicate it
+            if attempt == MAX_RETRIES:
+                raise
+            delay = _retry_delay(None, attempt)
+            logger.warning(f"Failed to connect to OpenAI API ({e!r}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+            continue
         
-        # Prepare request data
-        data = {
-            "model": "dall-e-3",
-            "prompt": prompt,
-            "n": n,
-            "size": size,
-            "response_format": response_format,
-            "style": style,
-            "quality": quality
-        }
+        if response.status_code == 200:
+            break
         
-        logger.info(f"Making request to OpenAI API: {url} with data: {json.dumps(data, indent=2)}")
+        # Back off on rate limits and server errors, without holding a semaphore slot
+        if response.status_code in RETRY_STATUS_CODES and attempt < MAX_RETRIES:
+            delay = _retry_delay(response, attempt)
+            logger.warning(f"OpenAI API returned {response.status_code}, retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+            continue
         
-        # Try with system proxies first (which might be needed in some environments)
+        error_detail = "Unknown error"
         try:
-            logger.info("Attempting connection with system proxies...")
-            async with httpx.AsyncClient(trust_env=True, timeout=60.0) as client:
-                response = await client.post(url, headers=headers, json=data)
-                logger.info(f"Connection with system proxies successful, status: {response.status_code}")
-                if response.status_code == 200:
-                    return process_response(response, response_format)
+            error_json = orjson.loads(response.content)
+            if "error" in error_json:
+                error_detail = error_json["error"].get("message", str(error_json))
+            else:
+                error_detail = str(error_json)
         except Exception as e:
-            logger.warning(f"Connection with system proxies failed: {str(e)}")
+            error_detail = f"Failed to parse error response: {str(e)}, Raw content: {response.text}"
         
-        # If that fails, try direct connection without proxies
-        logger.info("Attempting direct connection without proxies...")
-        async with httpx.AsyncClient(trust_env=False) as client:
-            try:
-                response = await client.post(url, headers=headers, json=data, timeout=60.0)
-                
-                # Log the response status and headers
-                logger.info(f"OpenAI API response status: {response.status_code}")
-                logger.info(f"OpenAI API response headers: {response.headers}")
-                
-                # Try to get the response content
-                content = response.content
-                logger.info(f"OpenAI API response content: {content}")
-                
-                # Check if the response is successful
-                if response.status_code != 200:
-                    error_detail = "Unknown error"
-                    try:
-                        error_json = response.json()
-                        if "error" in error_json:
-                            error_detail = error_json["error"].get("message", str(error_json))
-                        else:
-                            error_detail = str(error_json)
-                    except Exception as e:
-                        error_detail = f"Failed to parse error response: {str(e)}, Raw content: {content}"
-                    
-                    logger.error(f"OpenAI API error: {error_detail}")
-                    raise HTTPException(status_code=response.status_code, detail=error_detail)
-                
-                # Parse the response
-                result = response.json()
-                logger.info("Successfully parsed OpenAI API response")
-                
-                return process_response(response, response_format)
-                    
-            except httpx.TimeoutException:
-                logger.error("OpenAI API request timed out")
-                raise HTTPException(status_code=504, detail="API request timed out")
-            except httpx.RequestError as e:
-                logger.error(f"OpenAI API request error: {str(e)}")
-                raise HTTPException(status_code=502, detail=f"API request failed: {str(e)}")
-            
-    except Exception as e:
-        logger.exception(f"Error in generate_image: {str(e)}")
-        if isinstance(e, HTTPException):
-            raise e
-        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+        logger.error(f"OpenAI API error: {error_detail}")
+        raise HTTPException(status_code=response.status_code, detail=error_detail)
+    
+    # Parse the response
+    result = orjson.loads(response.content)
+    logger.info("Successfully parsed OpenAI API response")
+    
+    return process_response(result, response_format)
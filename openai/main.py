@@ -1,15 +1,64 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, HTMLResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, HTMLResponse, ORJSONResponse
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
 from pydantic import BaseModel
+import httpx
 import uvicorn
 from typing import List, Optional
+import logging
+import logging.handlers
 import os
+import queue
 
 from app.routers import image_router
 from app.config import get_settings
+from app.services.image_processing_service import close_http_client
+from app.services.openai_service import create_client, log_network_info
+
+# Development runs log every request; otherwise only warnings and errors.
+# LOG_LEVEL overrides either default.
+DEV_MODE = os.getenv("ENV") == "dev"
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO" if DEV_MODE else "WARNING").upper()
+
+logger = logging.getLogger(__name__)
+
+# Background thread writing queued log records to stderr, set up at startup
+_log_listener: Optional[logging.handlers.QueueListener] = None
+
+def start_log_listener() -> None:
+    """
+    Route root logging through a queue so request handlers never block on
+    log I/O; a background thread writes the records to stderr. Does nothing
+    if a QueueHandler is already installed, since this module can be
+    imported twice (as __main__ and as main) in one process.
+    """
+    global _log_listener
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+    if any(isinstance(h, logging.handlers.QueueHandler) for h in root.handlers):
+        return
+    log_queue = queue.SimpleQueue()
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    # Same line format basicConfig used: LEVEL:logger.name:message
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+    _log_listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    _log_listener.start()
+
+def stop_log_listener() -> None:
+    """Flush queued log records and remove the handler added by start_log_listener."""
+    global _log_listener
+    if _log_listener is None:
+        return
+    root = logging.getLogger()
+    for handler in [h for h in root.handlers if isinstance(h, logging.handlers.QueueHandler)]:
+        if handler.queue is _log_listener.queue:
+            root.removeHandler(handler)
+    _log_listener.stop()
+    _log_listener = None
 
 # Get application settings
 settings = get_settings()
@@ -17,32 +66,72 @@ settings = get_settings()
 app = FastAPI(
     title="Text to Image API",
     description="API for generating images from text using OpenAI",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 # CORS configuration
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
+    allow_origins=[origin.strip() for origin in settings.cors_origins.split(",")],
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-    expose_headers=["*"]
+    allow_methods=["GET", "POST", "OPTIONS"],
+    allow_headers=["Content-Type", "Authorization"],
+    max_age=86400  # Let browsers cache preflight responses for a day
 )
 
+# Compress larger responses such as base64 image payloads. Base64 text shrinks
+# through entropy coding, which the fastest level already does.
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=1)
+
 # Include routers
 app.include_router(image_router.router, prefix="/api")
 
 # Mount the static files directory
-app.mount("/static", StaticFiles(directory="static"), name="static")
+static_files = StaticFiles(directory="static")
+app.mount("/static", static_files, name="static")
+
+# Map failed upstream HTTP calls (OpenAI API, image downloads) to gateway errors
+@app.exception_handler(httpx.TimeoutException)
+async def upstream_timeout_handler(request, exc):
+    logger.error(f"Upstream request timed out: {exc!r}")
+    return ORJSONResponse(status_code=504, content={"detail": "API request timed out"})
+
+@app.exception_handler(httpx.RequestError)
+async def upstream_error_handler(request, exc):
+    logger.error(f"Upstream request error: {exc!r}")
+    return ORJSONResponse(status_code=502, content={"detail": f"API request failed: {exc}"})
+
+@app.on_event("startup")
+async def startup():
+    start_log_listener()
+    app.state.openai_client = create_client(trust_env=settings.openai_use_system_proxy)
+    await run_in_threadpool(log_network_info)
+
+@app.on_event("shutdown")
+async def shutdown():
+    await app.state.openai_client.aclose()
+    await close_http_client()
+    stop_log_listener()
 
-@app.get("/", response_class=HTMLResponse)
-async def root():
-    return FileResponse('static/index.html')
+@app.api_route("/", methods=["GET", "HEAD"], response_class=HTMLResponse)
+async def root(request: Request):
+    # Served through StaticFiles for its ETag/Last-Modified handling and 304s
+    return await static_files.get_response("index.html", request.scope)
 
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
 
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
+    if DEV_MODE:
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
+    else:
+        # uvicorn[standard] provides uvloop and httptools, which are picked automatically
+        uvicorn.run(
+            "main:app",
+            host="0.0.0.0",
+            port=8000,
+            workers=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1)),
+            log_level=LOG_LEVEL.lower()
+        )
@@ -106,7 +106,7 @@ document.addEventListener('DOMContentLoaded', function () {
                 }
                 const overlayData = await overlayResp.json();
                 // Display the result
-                displayResults({ images: [overlayData.image], prompt: prompt }, prompt);
+                displayResults({ images: [toDataUrl(overlayData)], prompt: prompt }, prompt);
             } catch (error) {
                 console.error('Error:', error);
                 if (resultsDiv) {
@@ -209,7 +209,7 @@ document.addEventListener('DOMContentLoaded', function () {
                 }
                 const overlayData = await overlayResp.json();
                 console.log('Overlay API response:', overlayData);
-                data.images[0] = overlayData.image;
+                data.images[0] = toDataUrl(overlayData);
             }
 
             // Now display the results
@@ -255,12 +255,11 @@ document.addEventListener('DOMContentLoaded', function () {
             imgElement.className = 'result-image mb-3';
             imgElement.alt = `Generated image ${index + 1} for: ${prompt}`;
             
-            // Handle both URL and base64 formats
-            if (image.startsWith('http')) {
-                imgElement.src = image;
-            } else {
-                imgElement.src = `data:image/png;base64,${image}`;
-            }
+            // Handle URLs, data URLs and bare base64 (DALL-E returns PNG)
+            const src = image.startsWith('http') || image.startsWith('data:')
+                ? image
+                : `data:image/png;base64,${image}`;
+            imgElement.src = src;
             
             resultsDiv.appendChild(imgElement);
             
@@ -268,18 +267,25 @@ document.addEventListener('DOMContentLoaded', function () {
             const downloadBtn = document.createElement('a');
             downloadBtn.className = 'btn btn-sm btn-outline-primary mb-4 d-block';
             downloadBtn.innerHTML = 'Download Image';
-            downloadBtn.setAttribute('download', `dalle-image-${Date.now()}-${index}.png`);
-            
-            if (image.startsWith('http')) {
-                downloadBtn.href = image;
-            } else {
-                downloadBtn.href = `data:image/png;base64,${image}`;
-            }
+            downloadBtn.setAttribute('download', `dalle-image-${Date.now()}-${index}.${fileExtension(src)}`);
+            downloadBtn.href = src;
             
             resultsDiv.appendChild(downloadBtn);
         });
     }
 
+    // Helper to build a data URL from an /add-text response, which may be JPEG, PNG or WebP
+    function toDataUrl(overlayData) {
+        return `data:${overlayData.media_type};base64,${overlayData.image}`;
+    }
+
+    // Helper to pick a download file extension from a data URL's MIME type
+    function fileExtension(src) {
+        const match = src.match(/^data:image\/([a-z]+);/);
+        if (!match) return 'png';
+        return match[1] === 'jpeg' ? 'jpg' : match[1];
+    }
+
     // Helper to convert blob to base64
     async function blobToBase64(blob) {
         return new Promise((resolve, reject) => {
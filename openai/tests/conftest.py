@@ -0,0 +1,37 @@
+import os
+
+import httpx
+import pytest
+
+# Settings require an API key; tests never reach the real API
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+from app.services import openai_service
+
+
+class ChunkedStream(httpx.AsyncByteStream):
+    """Response body delivered in fixed-size chunks, like a slow network read."""
+
+    def __init__(self, body: bytes, chunk_size: int):
+        self._body = body
+        self._chunk_size = chunk_size
+
+    async def __aiter__(self):
+        for i in range(0, len(self._body), self._chunk_size):
+            yield self._body[i:i + self._chunk_size]
+
+
+@pytest.fixture(autouse=True)
+def fresh_semaphore():
+    """Give each test's event loop its own semaphore."""
+    openai_service._semaphore.cache_clear()
+    yield
+    openai_service._semaphore.cache_clear()
+
+
+@pytest.fixture
+def mock_openai_client():
+    """Build an OpenAI client whose responses come from the given handler."""
+    def build(handler) -> httpx.AsyncClient:
+        return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return build
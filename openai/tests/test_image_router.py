@@ -0,0 +1,64 @@
+import base64
+import io
+
+import httpx
+import orjson
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from conftest import ChunkedStream
+from main import app
+
+
+def _png_bytes(size=(512, 512)) -> bytes:
+    output = io.BytesIO()
+    Image.effect_noise(size, 64).convert("RGB").save(output, format="PNG")
+    return output.getvalue()
+
+
+@pytest.fixture
+def client_with_openai(mock_openai_client):
+    """Run the app with its OpenAI client replaced by one using the given handler."""
+    with TestClient(app) as client:
+        real_client = app.state.openai_client
+
+        def build(handler) -> TestClient:
+            app.state.openai_client = mock_openai_client(handler)
+            return client
+
+        yield build
+        app.state.openai_client = real_client
+
+
+def test_generate_raw_returns_decoded_png(client_with_openai):
+    png = _png_bytes()
+    body = orjson.dumps({"data": [{"b64_json": base64.b64encode(png).decode()}]})
+    client = client_with_openai(lambda request: httpx.Response(200, stream=ChunkedStream(body, 10_000)))
+
+    response = client.post("/api/images/generate/raw", json={"prompt": "a cat"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/png"
+    assert response.content == png
+
+
+def test_generate_b64_json(client_with_openai):
+    encoded = base64.b64encode(_png_bytes()).decode()
+    body = orjson.dumps({"data": [{"b64_json": encoded}]})
+    client = client_with_openai(lambda request: httpx.Response(200, stream=ChunkedStream(body, 10_000)))
+
+    response = client.post(
+        "/api/images/generate", json={"prompt": "a cat", "response_format": "b64_json"}
+    )
+
+    assert response.status_code == 200
+    assert response.json() == {"images": [encoded], "prompt": "a cat"}
+
+
+def test_generate_raw_rejects_multiple_images(client_with_openai):
+    client = client_with_openai(lambda request: pytest.fail("OpenAI API should not be called"))
+
+    response = client.post("/api/images/generate/raw", json={"prompt": "a cat", "n": 2})
+
+    assert response.status_code == 400
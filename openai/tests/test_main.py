@@ -0,0 +1,39 @@
+import logging
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from main import app
+
+
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+
+def test_index_served_at_root(client):
+    response = client.get("/")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/html")
+    assert client.get("/", headers={"If-None-Match": response.headers["etag"]}).status_code == 304
+
+
+@pytest.mark.parametrize("path", ["/api/images/generate", "/api/images/generate/raw", "/api/images/add-text"])
+def test_api_routes_reject_get_with_405(client, path):
+    assert client.get(path).status_code == 405
+
+
+def test_unknown_path_is_404(client):
+    assert client.get("/no-such-page").status_code == 404
+
+
+def test_log_listener_keeps_level_and_logger_name(capfd):
+    main.start_log_listener()
+    try:
+        logging.getLogger("app.services.openai_service").warning("hello warn")
+    finally:
+        main.stop_log_listener()
+
+    assert "WARNING:app.services.openai_service:hello warn" in capfd.readouterr().err
@@ -0,0 +1,102 @@
+import asyncio
+import base64
+import os
+
+import httpx
+import orjson
+import pytest
+from fastapi import HTTPException
+
+from app.services import openai_service
+from app.services.openai_service import generate_image
+from conftest import ChunkedStream
+
+
+def _b64_images(count: int, size: int):
+    return [base64.b64encode(os.urandom(size)).decode() for _ in range(count)]
+
+
+def test_generate_image_streams_multi_chunk_b64_json(mock_openai_client):
+    # Two ~3 MB images, split into chunks smaller than the reader's 64 KiB
+    images = _b64_images(2, 2_250_000)
+    body = orjson.dumps({"created": 0, "data": [{"b64_json": image} for image in images]})
+
+    def handler(request):
+        assert orjson.loads(request.content)["response_format"] == "b64_json"
+        return httpx.Response(200, stream=ChunkedStream(body, 10_000))
+
+    async def run():
+        async with mock_openai_client(handler) as client:
+            return await generate_image(client, "a cat", n=2, response_format="b64_json")
+
+    assert asyncio.run(run()) == images
+
+
+def test_generate_image_b64_json_single_chunk(mock_openai_client):
+    images = _b64_images(1, 1000)
+    body = orjson.dumps({"data": [{"b64_json": images[0]}]})
+
+    async def run():
+        async with mock_openai_client(lambda request: httpx.Response(200, content=body)) as client:
+            return await generate_image(client, "a cat", response_format="b64_json")
+
+    assert asyncio.run(run()) == images
+
+
+def test_generate_image_url(mock_openai_client):
+    body = orjson.dumps({"data": [{"url": "https://example.com/a.png"}]})
+
+    async def run():
+        async with mock_openai_client(lambda request: httpx.Response(200, content=body)) as client:
+            return await generate_image(client, "a cat")
+
+    assert asyncio.run(run()) == ["https://example.com/a.png"]
+
+
+@pytest.fixture
+def no_retry_delay(monkeypatch):
+    monkeypatch.setattr(openai_service, "_retry_delay", lambda response, attempt: 0)
+
+
+def _respond_in_order(*responses):
+    """Handler returning the given responses in turn, recording each request."""
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return responses[len(calls) - 1]
+
+    return handler, calls
+
+
+@pytest.mark.parametrize("status", [429, 503])
+def test_generate_image_retries_retryable_status(mock_openai_client, no_retry_delay, status):
+    body = orjson.dumps({"data": [{"url": "https://example.com/a.png"}]})
+    handler, calls = _respond_in_order(
+        httpx.Response(status, headers={"Retry-After": "1"}, json={"error": {"message": "busy"}}),
+        httpx.Response(200, content=body),
+    )
+
+    async def run():
+        async with mock_openai_client(handler) as client:
+            return await generate_image(client, "a cat")
+
+    assert asyncio.run(run()) == ["https://example.com/a.png"]
+    assert len(calls) == 2
+
+
+@pytest.mark.parametrize("status", [500, 502, 504])
+def test_generate_image_does_not_retry_possibly_completed_request(mock_openai_client, no_retry_delay, status):
+    handler, calls = _respond_in_order(
+        httpx.Response(status, json={"error": {"message": "upstream failed"}}),
+    )
+
+    async def run():
+        async with mock_openai_client(handler) as client:
+            return await generate_image(client, "a cat")
+
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(run())
+    assert exc_info.value.status_code == status
+    assert exc_info.value.detail == "upstream failed"
+    assert len(calls) == 1